@@ -4,6 +4,8 @@ import re
 import csv
 import datetime
 import os
+import codecs
+from concurrent.futures import ThreadPoolExecutor
 
 # --- ドラッグ＆ドロップ用ライブラリ ---
 try:
@@ -16,47 +18,91 @@ except ImportError:
 # ==========================================
 # 1. 解析ロジック (G00と切削を分離)
 # ==========================================
+def _merge_minmax(a, b):
+    """2つの (最小, 最大) を結合する (None は無視)"""
+    if a[0] is None: return tuple(b)
+    if b[0] is None: return tuple(a)
+    return (min(a[0], b[0]), max(a[1], b[1]))
+
+def fmt_range(min_v, max_v):
+    """Min/Maxを "min ~ max" 形式に (値なしは "-")"""
+    if min_v is None:
+        return "-"
+    return f"{min_v:.3f} ~ {max_v:.3f}"
+
+# 軸名 -> 軸番号 (BlockData.rapid / cut の添字)
+AXIS_IDX = {"X": 0, "Y": 1, "Z": 2}
+
 class BlockData:
     def __init__(self, name):
         self.name = name
-        # 2つの辞書で管理 (rapid=早送り, cut=切削)
-        self.rapid = {"X": [], "Y": [], "Z": []}
-        self.cut = {"X": [], "Y": [], "Z": []}
-        self.s_vals = []
-        self.f_vals = []
+        # 2つのリストで管理 (rapid=早送り, cut=切削)。添字は AXIS_IDX (0=X, 1=Y, 2=Z)
+        # 値は溜め込まず、軸ごとに [最小, 最大] だけを随時更新する
+        self.rapid = [[None, None], [None, None], [None, None]]
+        self.cut = [[None, None], [None, None], [None, None]]
+        self.max_s = 0
+        self.max_f = 0
         self.errors = []
 
-    def add_val(self, axis, val, is_rapid):
-        # モードに応じて格納先を変える
-        target = self.rapid if is_rapid else self.cut
-        if axis in target:
-            target[axis].append(val)
-    
     def get_range_str(self, axis, mode="both"):
         """指定された軸とモードの最小～最大を文字列で返す"""
-        vals = []
-        if mode == "rapid" or mode == "both":
-            vals.extend(self.rapid[axis])
-        if mode == "cut" or mode == "both":
-            vals.extend(self.cut[axis])
-            
-        if not vals:
-            return "-"
-        return f"{min(vals):.3f} ~ {max(vals):.3f}"
+        return fmt_range(*self.get_raw_min_max(axis, mode))
 
     def get_raw_min_max(self, axis, mode="both"):
         """数値としてMin/Maxを返す（CSVやリミットチェック用）"""
-        vals = []
-        if mode == "rapid" or mode == "both":
-            vals.extend(self.rapid[axis])
-        if mode == "cut" or mode == "both":
-            vals.extend(self.cut[axis])
-        return (min(vals), max(vals)) if vals else (None, None)
+        i = AXIS_IDX[axis]
+        if mode == "rapid":
+            return tuple(self.rapid[i])
+        if mode == "cut":
+            return tuple(self.cut[i])
+        return _merge_minmax(self.rapid[i], self.cut[i])
 
     def get_max_s_f(self):
-        max_s = max(self.s_vals) if self.s_vals else 0
-        max_f = max(self.f_vals) if self.f_vals else 0
-        return max_s, max_f
+        return self.max_s, self.max_f
+
+# 1行分 (';' より前を大文字化したもの) から語を拾う正規表現 (import時に1回だけコンパイル)
+# ※ ( ) の中の語も従来どおり読む (コメントはブロック名として別に探す)
+_RE_COORD = re.compile(r'([XYZ])\s*(-?\d+\.?\d*)')
+_RE_S = re.compile(r'S\s*(\d+)')
+_RE_F = re.compile(r'F\s*(\d+\.?\d*)')
+_RE_G = re.compile(r'G(\d+)')
+
+def detect_encoding(head):
+    """ファイル先頭のbytesから文字コードを推定 (cp932 優先, ダメなら utf-8)"""
+    try:
+        # 末尾で2バイト文字が切れていてもエラーにしない
+        codecs.getincrementaldecoder('cp932')().decode(head, final=False)
+        return 'cp932'
+    except UnicodeDecodeError:
+        return 'utf-8'
+
+def load_nc_file(path):
+    """NCファイルを読み込み、文字コードを判定してデコードした文字列を返す (改行は LF に統一)"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    # 解析はデコード後の文字列で行う
+    # (cp932 の2バイト目を X/Y/Z 等と誤認しないよう、bytes のままは解析しない)
+    try:
+        content = data.decode(detect_encoding(data[:4096]))
+    except UnicodeDecodeError:
+        content = data.decode('utf-8')
+    # テキストモード (universal newlines) と同じく CRLF / CR を \n に揃える
+    return content.replace('\r\n', '\n').replace('\r', '\n')
+
+# --- 制御装置別の簡易チェック ---
+# 解析1回ごとに生成し、Gコードのある行ごとに (g_codes, 行番号, ブロック) で呼ばれる
+def _fanuc_lathe_check():
+    has_g50 = False
+    def check(g_codes, line_num, blk):
+        nonlocal has_g50
+        if 50 in g_codes: has_g50 = True
+        if 96 in g_codes and not has_g50:
+            blk.errors.append(f"[Line {line_num}] 危険: G50なしでG96使用")
+    return check
+
+_LINE_CHECKS = {
+    "FANUC_Lathe": _fanuc_lathe_check,
+}
 
 class NCAnalyzer:
     def __init__(self):
@@ -65,86 +111,116 @@ class NCAnalyzer:
     def reset(self):
         self.blocks = []
         self.current_block = None
-
-    def parse_value(self, text):
-        try: return float(text)
-        except ValueError: return None
+        # ブロック別統計の列指向テーブル (_build_stat_matrix で作成)
+        # analyze() 終了時点のスナップショットで、blocks と同じ順・同じ行数
+        self.stat_matrix = []
+        self.max_s_col = []
+        self.max_f_col = []
+        self._global_stats = None
 
     def analyze(self, nc_code, machine_type):
         self.reset()
         self.current_block = BlockData("Header / Setup")
         self.blocks.append(self.current_block)
 
-        lines = nc_code.split('\n')
-        
-        re_comment = re.compile(r'\((.*?)\)')
-        re_coord = re.compile(r'([XYZ])\s*([-]?\d+\.?\d*)')
-        re_s = re.compile(r'S\s*(\d+)')
-        re_f = re.compile(r'F\s*(\d+\.?\d*)')
-        re_g = re.compile(r'G(\d+)')
-
-        has_g50_global = False
+        # 機種はファイル全体で固定なので、チェック関数は解析開始時に1回だけ選ぶ
+        make_check = _LINE_CHECKS.get(machine_type)
+        line_check = make_check() if make_check else None
         is_rapid_mode = True # デフォルトはG00とする
 
-        for i, line in enumerate(lines):
-            line_num = i + 1
-            line_content = line.split(';')[0].strip()
+        find_coords = _RE_COORD.findall
+        find_g = _RE_G.findall
+        search_s = _RE_S.search
+        search_f = _RE_F.search
+        for line_num, line in enumerate(nc_code.split('\n'), 1):
+            line_content = line.split(';', 1)[0].strip()
             if not line_content: continue
 
-            # ブロック切り替え
-            comment_match = re_comment.search(line)
-            if comment_match:
-                block_name = comment_match.group(1).strip()
-                self.current_block = BlockData(f"Line{line_num}: {block_name}")
-                self.blocks.append(self.current_block)
-
-            # Gコードによるモード判定
-            g_codes = [int(g) for g in re_g.findall(line_content.upper())]
-            if 0 in g_codes:
-                is_rapid_mode = True
-            if any(g in [1, 2, 3] for g in g_codes):
-                is_rapid_mode = False
-
-            # 座標値の取得と振り分け
-            coords = re_coord.findall(line_content.upper())
-            for axis, val_str in coords:
-                val = self.parse_value(val_str)
-                if val is not None:
-                    # ここでモード情報を渡す！
-                    self.current_block.add_val(axis, val, is_rapid_mode)
-
-            # S, F
-            s_match = re_s.search(line_content.upper())
-            if s_match: self.current_block.s_vals.append(float(s_match.group(1)))
-            f_match = re_f.search(line_content.upper())
-            if f_match: self.current_block.f_vals.append(float(f_match.group(1)))
-
-            # 簡易チェック
-            if machine_type == "FANUC_Lathe":
-                if 50 in g_codes: has_g50_global = True
-                if 96 in g_codes and not has_g50_global:
-                    self.current_block.errors.append(f"[Line {line_num}] 危険: G50なしでG96使用")
-
+            # ブロック切り替え (行内で最初のコメント。';' より後ろにあっても使う)
+            start = line.find('(')
+            if start >= 0:
+                end = line.find(')', start + 1)
+                if end >= 0:
+                    self.current_block = BlockData(f"Line{line_num}: {line[start + 1:end].strip()}")
+                    self.blocks.append(self.current_block)
+            blk = self.current_block
+
+            # 大文字化は1行1回。G/S/F は行にその文字がなければ正規表現を呼ばない
+            code = line_content.upper()
+            g_codes = [int(g) for g in find_g(code)] if 'G' in code else []
+
+            # Gコードによるモード判定 (行内の記述順に関わらず行全体に適用)
+            if g_codes:
+                if 0 in g_codes:
+                    is_rapid_mode = True
+                if any(g in [1, 2, 3] for g in g_codes):
+                    is_rapid_mode = False
+
+            # 座標値の振り分け (モードに応じた格納先の [最小, 最大] をその場で更新)
+            coords = find_coords(code)
+            if coords:
+                target = blk.rapid if is_rapid_mode else blk.cut
+                for axis, val_str in coords:
+                    # 正規表現が数値の形を保証しているので float() は失敗しない
+                    val = float(val_str)
+                    t = target[AXIS_IDX[axis]]
+                    if t[0] is None or val < t[0]: t[0] = val
+                    if t[1] is None or val > t[1]: t[1] = val
+
+            # S, F (1行につき最初の1つ)
+            if 'S' in code:
+                m = search_s(code)
+                if m:
+                    s_val = float(m.group(1))
+                    if s_val > blk.max_s: blk.max_s = s_val
+            if 'F' in code:
+                m = search_f(code)
+                if m:
+                    f_val = float(m.group(1))
+                    if f_val > blk.max_f: blk.max_f = f_val
+
+            # 簡易チェック (制御装置ごとのチェック関数。対象外の機種では None)
+            if line_check is not None and g_codes:
+                line_check(g_codes, line_num, blk)
+
+        self._build_stat_matrix()
         return self.blocks
 
+    def _build_stat_matrix(self):
+        """ブロック別のMin/Maxを1ブロック1行 (12列) の表にまとめる
+        列順: G00 Min X, G00 Max X, Cut Min X, Cut Max X, (Y, Z も同順)
+        ※ analyze() の最後に1回だけ作る。以降は self.blocks と組にして読むこと"""
+        self.stat_matrix = [
+            (*blk.rapid[0], *blk.cut[0],
+             *blk.rapid[1], *blk.cut[1],
+             *blk.rapid[2], *blk.cut[2])
+            for blk in self.blocks
+        ]
+        self.max_s_col = [blk.max_s for blk in self.blocks]
+        self.max_f_col = [blk.max_f for blk in self.blocks]
+
     def get_global_stats(self):
         # 全体の最大最小（Rapid/Cut込み）
-        stats = { "X": [], "Y": [], "Z": [], "S": [], "F": [] }
-        for blk in self.blocks:
-            # Rapid
-            for ax in ["X", "Y", "Z"]:
-                stats[ax].extend(blk.rapid[ax])
-                stats[ax].extend(blk.cut[ax])
-            stats["S"].extend(blk.s_vals)
-            stats["F"].extend(blk.f_vals)
-        
+        # 解析ごとに1回だけ集計し、以降 (範囲チェック等) はキャッシュを返す
+        if self._global_stats is None:
+            self._global_stats = self._compute_global_stats()
+        return dict(self._global_stats)
+
+    def _compute_global_stats(self):
+        # stat_matrix を列単位で見て、軸ごとにG00/CutのMin/Maxを結合する
+        cols = list(zip(*self.stat_matrix))
         result = {}
-        for key in ["X", "Y", "Z"]:
-            vals = stats[key]
-            result[key] = (min(vals), max(vals)) if vals else (None, None)
-        
-        result["max_s"] = max(stats["S"]) if stats["S"] else 0
-        result["max_f"] = max(stats["F"]) if stats["F"] else 0
+        for k, key in enumerate(["X", "Y", "Z"]):
+            mm = (None, None)
+            if cols:
+                for c in (4*k, 4*k + 2):
+                    col_min = min((v for v in cols[c] if v is not None), default=None)
+                    col_max = max((v for v in cols[c + 1] if v is not None), default=None)
+                    mm = _merge_minmax(mm, (col_min, col_max))
+            result[key] = mm
+
+        result["max_s"] = max(self.max_s_col, default=0)
+        result["max_f"] = max(self.max_f_col, default=0)
         return result
 
 # ==========================================
@@ -160,6 +236,10 @@ class App:
 
         self.analyzer = NCAnalyzer()
         self.current_file_name = "未選択"
+        # 解析用ワーカー (1本だけ。解析は投入順に実行される)
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._analysis_future = None
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
         if DND_AVAILABLE:
             self.root.drop_target_register(DND_FILES)
@@ -263,6 +343,11 @@ class App:
         self.txt_log.pack(fill=tk.BOTH, expand=True)
         self.paned.add(frame_log, height=100)
 
+    def on_close(self):
+        # 待ち中の解析は取り消し、ワーカーの終了を待たずに画面を閉じる
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.root.destroy()
+
     # --- Limit Checker ---
     def open_limit_checker(self):
         if not hasattr(self, 'analyzed_blocks') or not self.analyzed_blocks:
@@ -326,21 +411,10 @@ class App:
 
     # --- File Ops ---
     def load_and_run(self, file_path):
-        self.txt_input.delete("1.0", tk.END)
         clean_path = file_path.strip('{}')
-        self.current_file_name = os.path.basename(clean_path)
-        self.lbl_filename.config(text=f"File: {self.current_file_name}")
-
-        try:
-            with open(clean_path, 'r', encoding='cp932') as f: content = f.read()
-        except:
-            try:
-                with open(clean_path, 'r', encoding='utf-8') as f: content = f.read()
-            except Exception as e:
-                messagebox.showerror("Error", str(e)); return
-
-        self.txt_input.insert(tk.END, content)
-        self.run_analysis()
+        # 読込と解析はワーカースレッドで行い、画面を固めない
+        # (ファイル名と本文の表示は成功してから _poll_analysis で差し替える)
+        self._start_analysis(clean_path, self.combo_machine.get())
 
     def drop_file(self, event):
         if event.data:
@@ -352,11 +426,44 @@ class App:
         path = filedialog.askopenfilename()
         if path: self.load_and_run(path)
 
-    def run_analysis(self):
-        code = self.txt_input.get("1.0", tk.END).strip()
-        machine = self.combo_machine.get()
-        
-        self.analyzed_blocks = self.analyzer.analyze(code, machine)
+    # --- Analysis (worker thread) ---
+    # ※ _load_and_analyze はワーカースレッドで動くので Tk を触らない
+    def _load_and_analyze(self, path, machine):
+        # 解析は表示用にデコードした文字列をそのまま使う
+        content = load_nc_file(path)
+        analyzer = NCAnalyzer()
+        blocks = analyzer.analyze(content, machine)
+        analyzer.get_global_stats() # 集計もワーカー側で済ませておく
+        return analyzer, blocks, content
+
+    def _start_analysis(self, path, machine):
+        self.root.config(cursor="watch")
+        self._analysis_future = self._executor.submit(self._load_and_analyze, path, machine)
+        self.root.after(50, self._poll_analysis, self._analysis_future, path)
+
+    def _poll_analysis(self, future, path):
+        # Tk はメインスレッドからしか触れないので、完了をafterでポーリングする
+        if future is not self._analysis_future: return # 後から新しい解析が始まった
+        if not future.done():
+            self.root.after(50, self._poll_analysis, future, path)
+            return
+
+        self.root.config(cursor="")
+        try:
+            analyzer, blocks, content = future.result()
+        except Exception as e:
+            messagebox.showerror("Error", str(e)); return
+
+        self.current_file_name = os.path.basename(path)
+        self.lbl_filename.config(text=f"File: {self.current_file_name}")
+        self.txt_input.delete("1.0", tk.END)
+        self.txt_input.insert(tk.END, content)
+        # 解析済みの analyzer ごと差し替える (解析中も前回の結果は壊さない)
+        self.analyzer = analyzer
+        self.analyzed_blocks = blocks
+        self.show_results()
+
+    def show_results(self):
         global_stats = self.analyzer.get_global_stats()
         
         def fmt_mm(vals):
@@ -368,36 +475,36 @@ class App:
         self.lbl_global_z.config(text=f"Z: {fmt_mm(global_stats['Z'])}")
         self.lbl_global_sf.config(text=f"Smax: {int(global_stats['max_s'])} / Fmax: {global_stats['max_f']:.1f}")
 
-        self.update_table(self.analyzed_blocks)
+        self.update_table()
         self.update_log(self.analyzed_blocks)
 
-    def update_table(self, blocks):
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+    def update_table(self):
+        # 全行を1回のdeleteでまとめて削除
+        self.tree.delete(*self.tree.get_children())
 
-        for i, blk in enumerate(blocks):
-            max_s, max_f = blk.get_max_s_f()
+        # 先に全行の表示値を作ってから、まとめて挿入する
+        # ブロック別統計は analyzer の列指向テーブルから行単位で取り出す
+        # (stat_matrix と行が揃っているのは analyzer.blocks なので、必ずそちらと組にする)
+        an = self.analyzer
+        rows = []
+        for i, (blk, r, max_s, max_f) in enumerate(zip(an.blocks, an.stat_matrix, an.max_s_col, an.max_f_col)):
             status = "WARN" if blk.errors else "OK"
             
-            # 各モードの範囲文字列を取得 ("min ~ max" または "-")
-            g0_x = blk.get_range_str("X", "rapid")
-            cut_x = blk.get_range_str("X", "cut")
-            g0_y = blk.get_range_str("Y", "rapid")
-            cut_y = blk.get_range_str("Y", "cut")
-            g0_z = blk.get_range_str("Z", "rapid")
-            cut_z = blk.get_range_str("Z", "cut")
-            
+            # 各モードの範囲文字列 ("min ~ max" または "-")
             values = (
                 blk.name, 
-                g0_x, cut_x, 
-                g0_y, cut_y, 
-                g0_z, cut_z, 
+                fmt_range(r[0], r[1]), fmt_range(r[2], r[3]), 
+                fmt_range(r[4], r[5]), fmt_range(r[6], r[7]), 
+                fmt_range(r[8], r[9]), fmt_range(r[10], r[11]), 
                 int(max_s), fmt(max_f) if max_f else "-", 
                 status
             )
-            
             tag = 'error' if blk.errors else ('odd' if i % 2 == 0 else 'even')
-            self.tree.insert("", tk.END, values=values, tags=(tag,))
+            rows.append((values, (tag,)))
+
+        insert = self.tree.insert
+        for values, tags in rows:
+            insert("", tk.END, values=values, tags=tags)
 
     def update_log(self, blocks):
         self.txt_log.delete("1.0", tk.END)
@@ -413,7 +520,8 @@ class App:
         filename = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV", "*.csv")], initialfile=f"Report_{self.current_file_name}.csv")
         if not filename: return
         try:
-            with open(filename, 'w', newline='', encoding='cp932') as f:
+            # 書き込みはバッファを大きめにして、まとめて出力する
+            with open(filename, 'w', newline='', encoding='cp932', buffering=1 << 20) as f:
                 writer = csv.writer(f)
                 # ヘッダーも詳細に分割
                 header = [
@@ -424,26 +532,14 @@ class App:
                     "Max S", "Max F", "Errors"
                 ]
                 writer.writerow(header)
-                for blk in self.analyzed_blocks:
-                    # それぞれの生データを取得
-                    g0_x = blk.get_raw_min_max("X", "rapid")
-                    cut_x = blk.get_raw_min_max("X", "cut")
-                    g0_y = blk.get_raw_min_max("Y", "rapid")
-                    cut_y = blk.get_raw_min_max("Y", "cut")
-                    g0_z = blk.get_raw_min_max("Z", "rapid")
-                    cut_z = blk.get_raw_min_max("Z", "cut")
-                    
-                    s, f_val = blk.get_max_s_f()
-                    err = " / ".join(blk.errors) if blk.errors else "OK"
-
-                    # リストを展開して行を作成
-                    row = [blk.name]
-                    for val_pair in [g0_x, cut_x, g0_y, cut_y, g0_z, cut_z]:
-                        row.extend([val_pair[0] if val_pair[0] is not None else "", 
-                                    val_pair[1] if val_pair[1] is not None else ""])
-                    row.extend([s, f_val, err])
-                    
-                    writer.writerow(row)
+
+                # stat_matrix の列順はヘッダーと同じ (値なしの None は csv が空欄で書く)
+                an = self.analyzer
+                rows = (
+                    (blk.name, *r, s, f_val, " / ".join(blk.errors) if blk.errors else "OK")
+                    for blk, r, s, f_val in zip(an.blocks, an.stat_matrix, an.max_s_col, an.max_f_col)
+                )
+                writer.writerows(rows)
             messagebox.showinfo("完了", "CSV保存完了！")
         except Exception as e: messagebox.showerror("Error", str(e))
 
@@ -0,0 +1,103 @@
+import os
+import tempfile
+import unittest
+
+from nc_checker_ultimate_v5 import NCAnalyzer, load_nc_file
+
+
+def analyze(code, machine="FANUC_Lathe"):
+    analyzer = NCAnalyzer()
+    return analyzer, analyzer.analyze(code, machine)
+
+
+class TestLineBoundaries(unittest.TestCase):
+    def test_address_without_value_does_not_take_next_line(self):
+        analyzer, blocks = analyze("(A)\nG01 X\n100. Z5\nG96 S100\n")
+        blk = blocks[1]
+        self.assertEqual(blk.get_raw_min_max("X"), (None, None))
+        self.assertEqual(blk.get_raw_min_max("Z", "cut"), (5.0, 5.0))
+        self.assertEqual(blk.errors, ["[Line 4] 危険: G50なしでG96使用"])
+
+    def test_s_without_value_at_line_end(self):
+        analyzer, blocks = analyze("G01 X1 S\n200")
+        self.assertEqual(blocks[0].get_max_s_f(), (0, 0))
+
+    def test_space_between_address_and_value(self):
+        analyzer, blocks = analyze("G00 X 1.5\tZ\t-2 Y\u30003")
+        self.assertEqual(blocks[0].get_raw_min_max("X", "rapid"), (1.5, 1.5))
+        self.assertEqual(blocks[0].get_raw_min_max("Z", "rapid"), (-2.0, -2.0))
+        self.assertEqual(blocks[0].get_raw_min_max("Y", "rapid"), (3.0, 3.0))
+
+
+class TestComments(unittest.TestCase):
+    def test_comment_after_semicolon_starts_block(self):
+        analyzer, blocks = analyze("G00 X1 ;(NOTE)\nG01 X2 ; X9 (IGNORED) \n")
+        self.assertEqual([b.name for b in blocks], ["Header / Setup", "Line1: NOTE", "Line2: IGNORED"])
+        # ';' 以降の座標は読まない
+        self.assertEqual(blocks[2].get_raw_min_max("X"), (2.0, 2.0))
+
+    def test_semicolon_only_line_is_skipped(self):
+        analyzer, blocks = analyze("  ;(HEADER NOTE)\nX1")
+        self.assertEqual(len(blocks), 1)
+        self.assertEqual(blocks[0].get_raw_min_max("X"), (1.0, 1.0))
+
+    def test_first_comment_on_line_names_block(self):
+        analyzer, blocks = analyze("(A) X1 ;(B)\n(C;D) X5")
+        self.assertEqual([b.name for b in blocks[1:]], ["Line1: A", "Line2: C;D"])
+        # コメントの途中の ';' でも、それより後ろは座標として読まない
+        self.assertEqual(blocks[2].get_raw_min_max("X"), (None, None))
+
+    def test_semicolon_comment_with_only_close_paren(self):
+        analyzer, blocks = analyze("G00 X1 ; see note 1)\nX2 ;)\nX3 ;()")
+        self.assertEqual([b.name for b in blocks], ["Header / Setup", "Line3: "])
+        self.assertEqual(blocks[0].get_raw_min_max("X", "rapid"), (1.0, 2.0))
+
+    def test_words_inside_comment_are_read(self):
+        analyzer, blocks = analyze("(ROUGH X10 G96)\nG00 X1")
+        self.assertEqual(blocks[1].get_raw_min_max("X"), (1.0, 10.0))
+        self.assertEqual(blocks[1].errors, ["[Line 1] 危険: G50なしでG96使用"])
+
+
+class TestStatMatrix(unittest.TestCase):
+    def test_rows_follow_blocks(self):
+        analyzer, blocks = analyze("G00 X1 Y2\n(A)\nG01 X-3 Z4 S500 F0.2\nG00 X7\n")
+        self.assertEqual(len(analyzer.stat_matrix), len(blocks))
+        for blk, row in zip(blocks, analyzer.stat_matrix):
+            expected = ()
+            for axis in "XYZ":
+                expected += blk.get_raw_min_max(axis, "rapid") + blk.get_raw_min_max(axis, "cut")
+            self.assertEqual(row, expected)
+        self.assertEqual(analyzer.max_s_col, [0, 500.0])
+        self.assertEqual(analyzer.get_global_stats()["X"], (-3.0, 7.0))
+
+
+class TestLoadFile(unittest.TestCase):
+    def load(self, data):
+        fd, path = tempfile.mkstemp(suffix=".nc")
+        with os.fdopen(fd, "wb") as f: f.write(data)
+        self.addCleanup(os.remove, path)
+        return load_nc_file(path)
+
+    def test_cp932_trail_byte_is_not_an_address(self):
+        # "ス" は cp932 で b"\x83X"
+        content = self.load("M05 ス10\r\n(工程)\r\nG00 X1\r\n".encode("cp932"))
+        self.assertEqual(content, "M05 ス10\n(工程)\nG00 X1\n")
+        analyzer, blocks = analyze(content)
+        self.assertEqual(blocks[0].get_raw_min_max("X"), (None, None))
+        self.assertEqual(blocks[1].name, "Line2: 工程")
+        self.assertEqual(blocks[1].get_raw_min_max("X", "rapid"), (1.0, 1.0))
+
+    def test_cr_only_line_endings(self):
+        content = self.load(b"(A)\rG00 X1\rG01 X5\rG96 S100\r")
+        self.assertEqual(content, "(A)\nG00 X1\nG01 X5\nG96 S100\n")
+        analyzer, blocks = analyze(content)
+        self.assertEqual(blocks[1].get_raw_min_max("X", "rapid"), (1.0, 1.0))
+        self.assertEqual(blocks[1].get_raw_min_max("X", "cut"), (5.0, 5.0))
+        self.assertEqual(blocks[1].errors, ["[Line 4] 危険: G50なしでG96使用"])
+
+    def test_empty_file(self):
+        self.assertEqual(self.load(b""), "")
+
+
+if __name__ == "__main__":
+    unittest.main()